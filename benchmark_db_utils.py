@@ -4,8 +4,13 @@ import datetime
 import json
 import logging
 import os
+import threading
+import time
+from collections import defaultdict, deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, ClassVar, NamedTuple
 
 import numpy as np
 import pandas as pd
@@ -32,10 +37,37 @@ from explainaboard_web.models import (
 )
 
 
+class _DataFrameLayout(NamedTuple):
+    """The datasets and columns of a leaderboard dataframe"""
+
+    dataset_configs: list[dict]
+    # (dataset_name, sub_dataset, split) to the index of the dataset
+    dataset_to_id: dict[tuple[str, str | None, str], int]
+    # dataset information columns of each dataset, None if it couldn't be found
+    dataset_infos: list[dict | None]
+    # metrics of each dataset as dicts, or None if they aren't specified
+    dataset_metrics_list: list[list[dict] | None]
+    columns: list[str]
+
+
 @dataclass
 class BenchmarkDBUtils:
     _SPECIAL_WEIGHT_MAPS = {"pop_weight": POP_WEIGHT, "ling_weight": LING_WEIGHT}
     _DEFAULT_SETS = {"all_lang": ALL_LANG}
+    # merged (parent-resolved) config dicts, keyed by benchmark id, along with the
+    # time they were loaded from DB
+    _CONFIG_CACHE_TTL = 60.0
+    _config_cache: ClassVar[dict[str, tuple[float, dict]]] = {}
+    # systems of each benchmark visible to each user, keyed by (benchmark id, user id),
+    # along with the time they were loaded from DB
+    _SYS_INFOS_CACHE_TTL = 30.0
+    _sys_infos_cache: ClassVar[
+        dict[tuple[str, str | None], tuple[float, list[SystemModel]]]
+    ] = {}
+    _sys_infos_lock = threading.Lock()
+    _PLOT_MAX_WORKERS = 8
+    # fields that are not needed when only listing benchmarks
+    _LIGHT_PROJECTION = {"views": 0, "metrics": 0}
 
     @staticmethod
     def _update_with_not_none_values(dest: dict, source: dict) -> None:
@@ -53,10 +85,79 @@ class BenchmarkDBUtils:
         doc["_id"] = doc["id"]
         doc.pop("id")
 
+    @staticmethod
+    def _find_config_dicts_by_ids(
+        benchmark_ids: list[str], projection: dict | None = None
+    ) -> dict[str, dict]:
+        """
+        Find the raw config dicts of multiple benchmarks with a single query
+        :return: a dict from benchmark id to config dict, aborts if any is missing
+        """
+        config_dicts = DBUtils.find_many_by_ids(
+            DBUtils.BENCHMARK_METADATA, benchmark_ids, projection=projection
+        )
+        id_to_config_dict = {}
+        for config_dict in config_dicts:
+            BenchmarkDBUtils._convert_id_from_db(config_dict)
+            id_to_config_dict[config_dict["id"]] = config_dict
+        missing_ids = [x for x in benchmark_ids if x not in id_to_config_dict]
+        if missing_ids:
+            abort_with_error_message(404, f"benchmark id: {missing_ids[0]} not found")
+        return id_to_config_dict
+
+    @staticmethod
+    def _merge_with_parents(
+        config_dicts: list[dict], projection: dict | None = None
+    ) -> list[dict]:
+        """
+        Fill in the fields that each config inherits from its parent(s). All parents
+        at the same level of inheritance are fetched with one query.
+        """
+        parents: dict[str, dict] = {}
+        pending = {x["parent"] for x in config_dicts if x.get("parent")}
+        while pending:
+            parents.update(
+                BenchmarkDBUtils._find_config_dicts_by_ids(list(pending), projection)
+            )
+            pending = {
+                x["parent"] for x in parents.values() if x.get("parent")
+            } - parents.keys()
+
+        def merge(config_dict: dict) -> dict:
+            parent_id = config_dict.get("parent")
+            if not parent_id:
+                return config_dict
+            parent_dict = dict(merge(parents[parent_id]))
+            BenchmarkDBUtils._update_with_not_none_values(parent_dict, config_dict)
+            return parent_dict
+
+        return [merge(config_dict) for config_dict in config_dicts]
+
+    @staticmethod
+    def create_indexes() -> None:
+        """
+        Create the indexes used by the `find_configs` filter. Creating an index that
+        already exists is a no-op, so this is safe to call on every app start.
+        """
+        DBUtils.create_index(
+            DBUtils.BENCHMARK_METADATA, [("parent", 1), ("is_private", 1)]
+        )
+        DBUtils.create_index(DBUtils.BENCHMARK_METADATA, [("creator", 1)])
+        DBUtils.create_index(DBUtils.BENCHMARK_METADATA, [("shared_users", 1)])
+
     @staticmethod
     def find_configs(
-        benchmark: str | None, parent: str | None, page: int = 0, page_size: int = 0
+        benchmark: str | None,
+        parent: str | None,
+        page: int = 0,
+        page_size: int = 0,
+        light: bool = False,
     ) -> list[BenchmarkConfig]:
+        """
+        Find the configs of the benchmarks visible to the current user
+        :param light: if True, leave out the views and metrics of each config, which
+              aren't needed to list benchmarks
+        """
         permissions_list = [{"is_private": False}]
         user = explainaboard_web.impl.auth.get_user()
         if user:
@@ -70,25 +171,25 @@ class BenchmarkDBUtils:
             and_list.append({"parent": parent})
 
         filt = {"$and": and_list}
+        projection = BenchmarkDBUtils._LIGHT_PROJECTION if light else None
         cursor, _ = DBUtils.find(
-            DBUtils.BENCHMARK_METADATA, filt=filt, limit=page * page_size
+            DBUtils.BENCHMARK_METADATA,
+            filt=filt,
+            limit=page * page_size,
+            projection=projection,
+            count_total=False,
+            batch_size=500,
         )
 
         config_dicts = []
-        for config_dict in list(cursor):
+        # iterate over the cursor directly with large batches rather than loading all
+        # documents before processing them
+        for config_dict in cursor:
             BenchmarkDBUtils._convert_id_from_db(config_dict)
-            parent_id = config_dict.get("parent")
-            if parent_id:
-                # do not insert preferred username here as every single config will
-                # issue a find instruction in DB, which creates a lot of overhead
-                parent_config = BenchmarkDBUtils.find_config_by_id(
-                    parent_id, include_preferred_username=False
-                )
-                parent_dict = parent_config.to_dict()
-                BenchmarkDBUtils._update_with_not_none_values(parent_dict, config_dict)
-                config_dict = parent_dict
-
             config_dicts.append(config_dict)
+        # parents are fetched in batch rather than issuing one find instruction in
+        # DB per config, which creates a lot of overhead
+        config_dicts = BenchmarkDBUtils._merge_with_parents(config_dicts, projection)
 
         # insert preferred usernames in batch to reduce overhead in DB
         UserDBUtils.insert_preferred_usernames(config_dicts)
@@ -96,20 +197,40 @@ class BenchmarkDBUtils:
         return [BenchmarkConfig.from_dict(config_dict) for config_dict in config_dicts]
 
     @staticmethod
-    def find_config_by_id(
-        benchmark_id: str, include_preferred_username: bool = True
-    ) -> BenchmarkConfig:
+    def _cached_config_dict(benchmark_id: str) -> dict:
+        """
+        Return the parent-resolved config dict of a benchmark. Results are cached for
+        `_CONFIG_CACHE_TTL` seconds, so callers get a (shallow) copy they can modify.
+        """
+        now = time.monotonic()
+        cached = BenchmarkDBUtils._config_cache.get(benchmark_id)
+        if cached is not None and now - cached[0] < BenchmarkDBUtils._CONFIG_CACHE_TTL:
+            return dict(cached[1])
+
         config_dict = DBUtils.find_one_by_id(DBUtils.BENCHMARK_METADATA, benchmark_id)
         if not config_dict:
             abort_with_error_message(404, f"benchmark id: {benchmark_id} not found")
         BenchmarkDBUtils._convert_id_from_db(config_dict)
+        config_dict = BenchmarkDBUtils._merge_with_parents([config_dict])[0]
+        BenchmarkDBUtils._config_cache[benchmark_id] = (now, config_dict)
+        return dict(config_dict)
 
-        parent_id = config_dict.get("parent")
-        if parent_id:
-            parent_config = BenchmarkDBUtils.find_config_by_id(parent_id)
-            parent_dict = parent_config.to_dict()
-            BenchmarkDBUtils._update_with_not_none_values(parent_dict, config_dict)
-            config_dict = parent_dict
+    @staticmethod
+    def _clear_caches() -> None:
+        # a change to one benchmark can affect all of its children, so drop everything
+        BenchmarkDBUtils._config_cache.clear()
+        BenchmarkDBUtils._clear_sys_infos_cache()
+
+    @staticmethod
+    def _clear_sys_infos_cache() -> None:
+        with BenchmarkDBUtils._sys_infos_lock:
+            BenchmarkDBUtils._sys_infos_cache.clear()
+
+    @staticmethod
+    def find_config_by_id(
+        benchmark_id: str, include_preferred_username: bool = True
+    ) -> BenchmarkConfig:
+        config_dict = BenchmarkDBUtils._cached_config_dict(benchmark_id)
 
         if include_preferred_username:
             UserDBUtils.insert_preferred_username(config_dict)
@@ -120,17 +241,18 @@ class BenchmarkDBUtils:
 
     @staticmethod
     def find_configs_featured() -> list[BenchmarkConfig]:
-        cursor, _ = DBUtils.find(DBUtils.BENCHMARK_FEATURED_LIST, limit=1)
+        cursor, _ = DBUtils.find(
+            DBUtils.BENCHMARK_FEATURED_LIST, limit=1, count_total=False
+        )
         cursor_list = list(cursor)
         if len(cursor_list) < 1:
             abort_with_error_message(500, "featured list not found")
 
-        config_dicts = []
-        for benchmark_id in cursor_list[0]["ids"]:
-            config_dict = BenchmarkDBUtils.find_config_by_id(
-                benchmark_id, include_preferred_username=False
-            ).to_dict()
-            config_dicts.append(config_dict)
+        featured_ids = cursor_list[0]["ids"]
+        id_to_config_dict = BenchmarkDBUtils._find_config_dicts_by_ids(featured_ids)
+        config_dicts = BenchmarkDBUtils._merge_with_parents(
+            [id_to_config_dict[benchmark_id] for benchmark_id in featured_ids]
+        )
 
         # insert preferred usernames in batch to reduce overhead in DB
         UserDBUtils.insert_preferred_usernames(config_dicts)
@@ -164,9 +286,11 @@ class BenchmarkDBUtils:
         # We discard all fields that have None values in update props.
         # This is important so that we don't overwrite existing fields in DB.
         props_dict = {k: v for k, v in props.to_dict().items() if v is not None}
-        return DBUtils.update_one_by_id(
+        result = DBUtils.update_one_by_id(
             DBUtils.BENCHMARK_METADATA, benchmark_id, props_dict
         )
+        BenchmarkDBUtils._clear_caches()
+        return result
 
     @staticmethod
     def delete_benchmark_by_id(benchmark_id: str):
@@ -177,11 +301,25 @@ class BenchmarkDBUtils:
         if config.creator != user.id:
             abort_with_error_message(403, "you can only delete your own benchmark")
         result = DBUtils.delete_one_by_id(DBUtils.BENCHMARK_METADATA, benchmark_id)
+        BenchmarkDBUtils._clear_caches()
         if not result:
             raise RuntimeError(f"failed to delete benchmark {benchmark_id}")
 
     @staticmethod
     def load_sys_infos(config: BenchmarkConfig) -> list[SystemModel]:
+        """
+        Load the systems of a benchmark. Results are cached for a short time, per user
+        because the systems that can be found depend on the user's permissions.
+        """
+        user = explainaboard_web.impl.auth.get_user()
+        cache_key = (config.id, user.id if user else None)
+        now = time.monotonic()
+        ttl = BenchmarkDBUtils._SYS_INFOS_CACHE_TTL
+        cached = BenchmarkDBUtils._sys_infos_cache.get(cache_key)
+        if cached is not None and now - cached[0] < ttl:
+            return list(cached[1])
+
+        generation = SystemDBUtils.get_change_generation()
         if config.system_query is not None:
             systems_return = SystemDBUtils.find_systems(
                 dataset_name=config.system_query.get("dataset_name"),
@@ -206,24 +344,31 @@ class BenchmarkDBUtils:
             raise ValueError("system_query or datasets must be set by each benchmark")
 
         ret_systems = [x for x in systems_return.systems if x.dataset is not None]
-        return ret_systems
+        cache = BenchmarkDBUtils._sys_infos_cache
+        with BenchmarkDBUtils._sys_infos_lock:
+            # drop expired entries so that the cache doesn't keep growing with users
+            for k in [k for k, v in cache.items() if now - v[0] >= ttl]:
+                del cache[k]
+            # systems that changed while loading may be missing from ret_systems
+            if SystemDBUtils.get_change_generation() == generation:
+                cache[cache_key] = (now, ret_systems)
+        return list(ret_systems)
 
     @staticmethod
     def generate_dataframe_from_sys_ids(config: BenchmarkConfig, system_ids: list[str]):
         return NotImplementedError
 
     @staticmethod
-    def generate_dataframe_from_sys_infos(
+    def _dataframe_layout(
         benchmark_config: BenchmarkConfig, systems: list[SystemModel]
-    ):
+    ) -> _DataFrameLayout:
         """
-        Generate a leaderboard from a list of system_output_info:SysOutputInfo
+        Work out the datasets and columns of a leaderboard dataframe, which don't
+        depend on the scores of the systems
         :param config: A benchmark config
-        :param systems: A list of SystemModel
-        :return: leaderboard:Leaderboard
+        :param systems: A list of SystemModel, used to find the datasets if the
+              benchmark doesn't list them
         """
-        # --- Get df entries
-
         # TODO(gneubig): this function is a bit hacky/fragile, using objects and dicts
         #                interchangeably due to OpenAPI deserialization being
         #                incomplete. Should be fixed.
@@ -232,20 +377,6 @@ class BenchmarkDBUtils:
         # Get from configuration if it exists
         if benchmark_config.datasets:
             dataset_configs = [dict(x) for x in benchmark_config.datasets]
-            dataset_to_id = {
-                (
-                    x["dataset_name"],
-                    x.get("sub_dataset", None),
-                    x.get("split", "test"),
-                ): i
-                for i, x in enumerate(dataset_configs)
-            }
-            systems = [
-                x
-                for x in systems
-                if (x.dataset.dataset_name, x.dataset.sub_dataset, x.dataset.split)
-                in dataset_to_id
-            ]
         # Collect (and deduplicate) all datasets from system infos otherwise
         else:
             dataset_tuples = list(
@@ -258,151 +389,230 @@ class BenchmarkDBUtils:
                 {"dataset_name": x, "sub_dataset": y, "split": z}
                 for x, y, z in dataset_tuples
             ]
-            dataset_to_id = {
-                (
-                    x["dataset_name"],
-                    x.get("sub_dataset", None),
-                    x.get("split", "test"),
-                ): i
-                for i, x in enumerate(dataset_configs)
-            }
-
-        dataset_metadatas: list[DatasetMetadata | None] = []
-        for x in dataset_configs:
-            dataset_return = DatasetDBUtils.find_datasets(
-                dataset_name=x["dataset_name"],
-                sub_dataset=x.get("sub_dataset", None),
-                strict_name_match=True,
-            )
-            if dataset_return.total == 1:
-                dataset_metadatas.append(dataset_return.datasets[0])
-            else:
-                logging.getLogger().warning(
-                    f"Could not find dataset "
-                    f'{x["dataset_name"]}, {x.get("sub_dataset", None)}'
-                )
-                dataset_metadatas.append(None)
-
-        # --- Rearrange so we have each system's result over each dataset
-        system_dataset_results: dict[str, list[SystemModel | None]] = {}
-        for sys in systems:
-            sys_name = sys.system_name
-            if sys_name not in system_dataset_results:
-                system_dataset_results[sys_name] = [None for _ in dataset_configs]
-            dataset_id = dataset_to_id[
-                (sys.dataset.dataset_name, sys.dataset.sub_dataset, sys.dataset.split)
-            ]
-            system_dataset_results[sys_name][dataset_id] = sys
-
-        system_to_creator: dict[str, str] = {
-            sys.system_name: sys.creator for sys in systems
+        dataset_to_id = {
+            (
+                x["dataset_name"],
+                x.get("sub_dataset", None),
+                x.get("split", "test"),
+            ): i
+            for i, x in enumerate(dataset_configs)
         }
 
+        # look up all datasets at once
+        dataset_keys = [
+            (x["dataset_name"], x.get("sub_dataset", None)) for x in dataset_configs
+        ]
+        key_to_metadata: dict[tuple[str, str | None], DatasetMetadata | None] = {}
+        if dataset_keys:
+            found = DatasetDBUtils.find_datasets_bulk(list(set(dataset_keys)))
+            for (dataset_name, sub_dataset), datasets in found.items():
+                if len(datasets) == 1:
+                    key_to_metadata[(dataset_name, sub_dataset)] = datasets[0]
+                else:
+                    logging.getLogger().warning(
+                        f"Could not find dataset {dataset_name}, {sub_dataset}"
+                    )
+                    key_to_metadata[(dataset_name, sub_dataset)] = None
+
         # --- Set up the columns of the dataframe
         # Default dataset information columns
-        df_input: dict[str, list] = {
-            "system_name": [],
-            "dataset_name": [],
-            "sub_dataset": [],
-            "dataset_split": [],
-            "creator": [],
-        }
+        columns = [
+            "system_name",
+            "dataset_name",
+            "sub_dataset",
+            "dataset_split",
+            "creator",
+        ]
         # Extra dataset information columns needed by datasets or operations
         exclude_keys = ["metrics"] + list(BenchmarkDBUtils._SPECIAL_WEIGHT_MAPS.keys())
         for dataset_config in dataset_configs:
             for dataset_key in dataset_config.keys():
-                if not (dataset_key in df_input or dataset_key in exclude_keys):
-                    df_input[dataset_key] = []
+                if not (dataset_key in columns or dataset_key in exclude_keys):
+                    columns.append(dataset_key)
         for view in benchmark_config.views:
             for operation in view.operations:
                 op_keys = [operation.get("weight")] + operation.get("group_by", [])
                 for op_key in op_keys:
-                    if op_key and not (op_key in df_input or op_key in exclude_keys):
-                        df_input[op_key] = []
+                    if op_key and not (op_key in columns or op_key in exclude_keys):
+                        columns.append(op_key)
+
+        # Columns regarding metric scores, which operations may already refer to
+        for key in ("metric", "metric_weight", "score"):
+            if key not in columns:
+                columns.append(key)
+
+        # --- Resolve the dataset information columns, which are the same for every
+        # system evaluated on a given dataset
+        system_keys = {"system_name", "creator", "metric", "metric_weight", "score"}
+        dataset_infos: list[dict | None] = []
+        for dataset_config, dataset_key in zip(dataset_configs, dataset_keys):
+            dataset_metadata = key_to_metadata[dataset_key]
+            if dataset_metadata is None:
+                dataset_infos.append(None)
+                continue
+            dataset_infos.append(
+                {
+                    key: BenchmarkDBUtils._dataset_column_value(
+                        key, dataset_config, dataset_metadata
+                    )
+                    for key in columns
+                    if key not in system_keys
+                }
+            )
 
-        # Columns regarding metric scores
-        df_input["metric"] = []
-        df_input["metric_weight"] = []
-        df_input["score"] = []
+        # Metrics of each dataset as dicts, or None if they aren't specified
+        dataset_metrics_list: list[list[dict] | None] = []
+        for dataset_config in dataset_configs:
+            config_metrics: list[BenchmarkMetric | dict] | None = dataset_config.get(
+                "metrics", benchmark_config.metrics
+            )
+            dataset_metrics_list.append(
+                None
+                if config_metrics is None
+                else [x if type(x) == dict else x.to_dict() for x in config_metrics]
+            )
 
-        # --- Create the actual data
-        for sys_name, systems in system_dataset_results.items():
-            for dataset_config, dataset_metadata, sys in zip(
-                dataset_configs, dataset_metadatas, systems
-            ):
-                if dataset_metadata is None:
-                    continue
-                column_dict = dict(dataset_config)
-                column_dict["system_name"] = sys_name
-                dataset_metrics: list[BenchmarkMetric] = dataset_config.get(
-                    "metrics", benchmark_config.metrics
+        return _DataFrameLayout(
+            dataset_configs=dataset_configs,
+            dataset_to_id=dataset_to_id,
+            dataset_infos=dataset_infos,
+            dataset_metrics_list=dataset_metrics_list,
+            columns=columns,
+        )
+
+    @staticmethod
+    def _system_records(
+        layout: _DataFrameLayout,
+        sys_name: str,
+        systems: list[SystemModel | None],
+        default_creator: str,
+    ) -> list[tuple[int, dict]]:
+        """
+        Create the dataframe rows of one system name
+        :param systems: the system evaluated on each dataset of the layout, or None
+              if there is none, in which case the default scores are used
+        :param default_creator: the creator of the rows without a system
+        :return: the rows along with the index of the dataset of each row
+        """
+        records: list[tuple[int, dict]] = []
+        rows = zip(
+            layout.dataset_configs,
+            layout.dataset_infos,
+            layout.dataset_metrics_list,
+            systems,
+        )
+        for dataset_id, row in enumerate(rows):
+            dataset_config, dataset_info, dataset_metrics, sys = row
+            if dataset_info is None:
+                continue
+            if dataset_metrics is None:
+                raise ValueError(
+                    f"metrics must be specified either on a global or "
+                    f'local level, but {dataset_config["dataset_name"]} -- '
+                    f'{dataset_config["sub_dataset"]} -- '
+                    f'{dataset_config["dataset_split"]} specified neither'
                 )
-                if dataset_metrics is None:
-                    raise ValueError(
-                        f"metrics must be specified either on a global or "
-                        f'local level, but {dataset_config["dataset_name"]} -- '
-                        f'{dataset_config["sub_dataset"]} -- '
-                        f'{dataset_config["dataset_split"]} specified neither'
+            # the best score of each metric of this system over all levels
+            sys_metric_scores: dict[str, Any] = {}
+            if sys is not None:
+                for level, m in sys.results.items():
+                    for k, v in m.items():
+                        if k not in sys_metric_scores or sys_metric_scores[k] < v:
+                            sys_metric_scores[k] = v
+            for dataset_metric in dataset_metrics:
+                if sys is not None:
+                    creator = sys.creator
+                    performance = sys_metric_scores.get(dataset_metric["name"])
+                    score = (
+                        performance
+                        if performance
+                        else (dataset_metric.get("default") or 0.0)
                     )
-                for dataset_metric in dataset_metrics:
-                    if type(dataset_metric) != dict:
-                        dataset_metric = dataset_metric.to_dict()
-                    column_dict["metric"] = dataset_metric["name"]
-                    column_dict["metric_weight"] = dataset_metric.get(
-                        "weight", 1.0 / len(dataset_metrics)
+                else:
+                    creator = default_creator
+                    score = dataset_metric.get("default") or 0.0
+                records.append(
+                    (
+                        dataset_id,
+                        {
+                            **dataset_info,
+                            "system_name": sys_name,
+                            "creator": creator,
+                            "metric": dataset_metric["name"],
+                            "metric_weight": dataset_metric.get(
+                                "weight", 1.0 / len(dataset_metrics)
+                            ),
+                            "score": score,
+                        },
                     )
-                    if sys is not None:
-                        column_dict["creator"] = sys.creator
-                        matching_results = []
-                        for level, m in sys.results.items():
-                            for k, v in m.items():
-                                if k == dataset_metric["name"]:
-                                    matching_results.append(v)
-                        if len(matching_results) == 0:
-                            performance = None
-                        else:
-                            performance = max(matching_results)
-                        column_dict["score"] = (
-                            performance
-                            if performance
-                            else (dataset_metric.get("default") or 0.0)
-                        )
-                    else:
-                        column_dict["creator"] = system_to_creator[sys_name]
-                        column_dict["score"] = dataset_metric.get("default") or 0.0
-                    for df_key, df_arr in df_input.items():
-                        if df_key in column_dict:
-                            info = column_dict[df_key]
-                        elif df_key == "sub_dataset":
-                            info = None
-                        elif df_key == "dataset_split":
-                            info = "test"
-                        elif df_key == "source_language":
-                            if len(dataset_metadata.languages) == 0:
-                                logging.getLogger().warning(
-                                    f"No languages found for "
-                                    f"{dataset_metadata.dataset_name}."
-                                )
-                                info = "eng"
-                            else:
-                                info = dataset_metadata.languages[0]
-                        elif df_key == "target_language":
-                            if len(dataset_metadata.languages) == 0:
-                                logging.getLogger().warning(
-                                    f"No languages found for "
-                                    f"{dataset_metadata.dataset_name}."
-                                )
-                                info = "eng"
-                            else:
-                                info = dataset_metadata.languages[-1]
-                        else:
-                            logging.getLogger().warning(
-                                f"No {df_key} found for "
-                                f"{dataset_metadata.dataset_name}."
-                            )
-                            info = None
-                        df_arr.append(info)
-        return pd.DataFrame(df_input)
+                )
+        return records
+
+    @staticmethod
+    def generate_dataframe_from_sys_infos(
+        benchmark_config: BenchmarkConfig, systems: list[SystemModel]
+    ):
+        """
+        Generate a leaderboard from a list of system_output_info:SysOutputInfo
+        :param config: A benchmark config
+        :param systems: A list of SystemModel
+        :return: leaderboard:Leaderboard
+        """
+        layout = BenchmarkDBUtils._dataframe_layout(benchmark_config, systems)
+
+        # --- Rearrange so we have each system's result over each dataset
+        system_dataset_results: defaultdict[
+            str, list[SystemModel | None]
+        ] = defaultdict(lambda: [None] * len(layout.dataset_configs))
+        system_to_creator: dict[str, str] = {}
+        for sys in systems:
+            dataset_id = layout.dataset_to_id.get(
+                (sys.dataset.dataset_name, sys.dataset.sub_dataset, sys.dataset.split)
+            )
+            if dataset_id is None:
+                continue
+            system_dataset_results[sys.system_name][dataset_id] = sys
+            system_to_creator[sys.system_name] = sys.creator
+
+        # --- Create the actual data
+        records: list[dict] = []
+        for sys_name, sys_results in system_dataset_results.items():
+            records.extend(
+                record
+                for _, record in BenchmarkDBUtils._system_records(
+                    layout, sys_name, sys_results, system_to_creator[sys_name]
+                )
+            )
+        return pd.DataFrame.from_records(records, columns=layout.columns)
+
+    @staticmethod
+    def _dataset_column_value(
+        key: str, dataset_config: dict, dataset_metadata: DatasetMetadata
+    ) -> Any:
+        """
+        Get the value of a dataset information column, falling back to defaults or
+        the dataset metadata if it isn't specified in the dataset config
+        """
+        if key in dataset_config:
+            return dataset_config[key]
+        elif key == "sub_dataset":
+            return None
+        elif key == "dataset_split":
+            return "test"
+        elif key in {"source_language", "target_language"}:
+            if len(dataset_metadata.languages) == 0:
+                logging.getLogger().warning(
+                    f"No languages found for {dataset_metadata.dataset_name}."
+                )
+                return "eng"
+            elif key == "source_language":
+                return dataset_metadata.languages[0]
+            else:
+                return dataset_metadata.languages[-1]
+        logging.getLogger().warning(
+            f"No {key} found for {dataset_metadata.dataset_name}."
+        )
+        return None
 
     @staticmethod
     def _gini(df: pd.DataFrame, numeric_only: bool) -> pd.Series:
@@ -411,26 +621,21 @@ class BenchmarkDBUtils:
         # http://www.statsdirect.com/help/generatedimages/equations/equation154.svg
         # from:
         # http://www.statsdirect.com/help/default.htm#nonparametric_methods/gini.htm
-        # All values are treated equally, arrays must be 1d:
-        # Get the score column for each task in df as a numpy array:
+        # All values are treated equally, each column is handled separately:
+        # Get all columns of df as a single 2d numpy array, sorted per column:
         if numeric_only:
             numerics = ["int16", "int32", "int64", "float16", "float32", "float64"]
             df = df.select_dtypes(include=numerics)
-        data = []
-        index = []
-        for col in df.columns:
-            array = df[col].to_numpy()
-            x = np.sort(array)
-            # Gini coefficient:
-            total = 0
-            for i, xi in enumerate(x[:-1], 1):
-                total += np.sum(np.abs(xi - x[i:]))
-            gini = total / (len(x) ** 2 * np.mean(x))
-            # Round off to 5 decimal places:
-            data.append(gini)
-            index.append(col)
-
-        return pd.Series(data=data, index=index)
+        x = np.sort(df.to_numpy(dtype=np.float64), axis=0)
+        n = x.shape[0]
+        # Gini coefficient, using the closed form over the sorted values
+        # (2 * sum_i i * x_i - (n + 1) * sum_i x_i) / (n * sum_i x_i),
+        # which is equal to sum_{i<j} |x_i - x_j| / (n^2 * mean(x))
+        x_sum = x.sum(axis=0)
+        cum = (np.arange(1, n + 1)[:, None] * x).sum(axis=0)
+        gini = (2 * cum - (n + 1) * x_sum) / (n * x_sum)
+
+        return pd.Series(data=gini, index=df.columns)
 
     @staticmethod
     def aggregate_view(
@@ -438,7 +643,12 @@ class BenchmarkDBUtils:
     ) -> pd.DataFrame:
         if input_df.empty:
             return input_df
-        output_df = input_df.copy()
+        # input_df is not copied, so none of the operations below may modify
+        # output_df in place; they create new dataframes instead
+        output_df = input_df
+        # rows added by add_default operations, which are concatenated to output_df
+        # all at once when the next other operation (or the end of the view) needs them
+        pending_defaults: list[pd.DataFrame] = []
         for operation in view_spec.operations:
             # group_by info
             group_by: str | list[str] = operation.get("group_by", [])
@@ -454,6 +664,11 @@ class BenchmarkDBUtils:
                 weight_map = BenchmarkDBUtils._SPECIAL_WEIGHT_MAPS[weight_map]
             # Perform operations
             op = operation["op"]
+            if op != "add_default" and pending_defaults:
+                output_df = pd.concat(
+                    [output_df, *pending_defaults], axis=0, ignore_index=True
+                )
+                pending_defaults = []
             if op in {"mean", "sum", "max", "min", "gini"}:
                 if len(group_by) > 0:
                     output_df = output_df.groupby(group_by)
@@ -480,29 +695,43 @@ class BenchmarkDBUtils:
                 # Adjust the logit of the weight to make it more or less peaky
                 weight_logit_multiplier = operation.get("weight_logit_multiplier")
                 if weight_logit_multiplier is not None:
-                    weight = np.exp(np.log(weight + 1e-8) * weight_logit_multiplier)
-                    weight /= sum(weight)
-                output_df["score"] = output_df["score"] * weight
+                    # exp(log(w) * k) == w ** k
+                    weight = np.power(weight + 1e-8, weight_logit_multiplier)
+                    weight /= weight.sum()
+                # weight is derived from output_df, so there is no index to align.
+                # Missing weights become NaN, like they would in a Series multiply.
+                output_df = output_df.assign(
+                    score=output_df["score"].to_numpy()
+                    * weight.to_numpy(dtype=float, na_value=np.nan)
+                )
                 if op == "weighted_sum":
                     if len(group_by):
-                        output_df = output_df.groupby(group_by).sum(numeric_only=True)
+                        # the groups don't need to be sorted to be summed
+                        output_df = output_df.groupby(group_by, sort=False).sum(
+                            numeric_only=True
+                        )
                     else:
                         output_df = output_df.sum(numeric_only=True)
             elif op in {"add_default"}:
+                column = operation["column"]
+                existing = set(output_df[column].values)
+                for pending_df in pending_defaults:
+                    if column in pending_df:
+                        existing.update(pending_df[column].values)
                 languages = [
                     lang
                     for lang in BenchmarkDBUtils._DEFAULT_SETS[operation["default_set"]]
-                    if lang not in output_df[operation["column"]].values
+                    if lang not in existing
                 ]
-                temp_df = pd.DataFrame(
-                    [[lang, 0] for lang in languages],
-                    columns=[operation["column"], "score"],
+                pending_defaults.append(
+                    pd.DataFrame(
+                        [[lang, 0] for lang in languages], columns=[column, "score"]
+                    )
                 )
-                output_df = pd.concat([output_df, temp_df], axis=0, ignore_index=True)
                 continue
             elif op in {"subtract"}:
-                output_df["score"] = output_df["score"].apply(
-                    lambda x: operation["num"] - x
+                output_df = output_df.assign(
+                    score=operation["num"] - output_df["score"]
                 )
             else:
                 raise ValueError(f"Unsupported operation {operation['op']} in spec.")
@@ -521,7 +750,12 @@ class BenchmarkDBUtils:
                 else:
                     output_df["system_name"] = "Overall"
             else:
-                output_df.reset_index(inplace=True)
+                output_df = output_df.reset_index()
+
+        if pending_defaults:
+            output_df = pd.concat(
+                [output_df, *pending_defaults], axis=0, ignore_index=True
+            )
 
         # Remove all numerical columns other than score
         output_df = pd.concat(
@@ -545,29 +779,29 @@ class BenchmarkDBUtils:
         return view_dfs
 
     @staticmethod
-    def _col_name(elem_names: list[str], df_entry):
+    def _col_names(elem_names: list[str], df: pd.DataFrame) -> pd.Series:
+        """
+        Get the column name of each row of df, made from the non-empty string values
+        of the elem_names columns
+        """
         # TODO(gneubig): This string-based representation may not be ideal
-        return "\n".join(
-            ["score"]
-            + [
-                f"{elem}={df_entry[elem]}"
-                for elem in elem_names
-                if df_entry[elem] and type(df_entry[elem]) == str
-            ]
-        )
+        col_names = pd.Series("score", index=df.index)
+        for elem in elem_names:
+            values = df[elem]
+            is_str = values.map(lambda v: isinstance(v, str) and v != "").astype(bool)
+            if not is_str.any():
+                continue
+            elem_col_names = "\n" + elem + "=" + values.where(is_str, "")
+            col_names = col_names + elem_col_names.where(is_str, "")
+        return col_names
 
     @staticmethod
     def dataframe_to_table(
         view_name: str, input_df: pd.DataFrame, plot_dict: dict, col_name: str
     ) -> BenchmarkTableData:
         elem_names = [x for x in input_df.columns if x not in {"score", col_name}]
-        system_idx = sorted(list(set(input_df[col_name])))
-        row_col_names = [
-            BenchmarkDBUtils._col_name(elem_names, x) for _, x in input_df.iterrows()
-        ]
-        column_idx = sorted(list(set(row_col_names)))
         # Terminate on empty data
-        if len(system_idx) == 0 or len(column_idx) == 0:
+        if len(input_df) == 0:
             return BenchmarkTableData(
                 name=view_name,
                 system_names=[],
@@ -576,19 +810,24 @@ class BenchmarkDBUtils:
                 plot_y_values=[],
                 plot_x_values=[],
             )
-        scores = pd.DataFrame(
-            {k: [0.0 for _ in system_idx] for k in column_idx}, index=system_idx
+        row_col_names = BenchmarkDBUtils._col_names(elem_names, input_df)
+        # rows are systems (or creators) and columns are the score names, both in
+        # sorted order. Missing cells are 0, and later rows win on duplicate cells.
+        scores = input_df.assign(_col_name=row_col_names).pivot_table(
+            index=col_name,
+            columns="_col_name",
+            values="score",
+            aggfunc="last",
+            fill_value=0.0,
+            # keep systems and columns whose scores are all NaN
+            dropna=False,
         )
-        for (_, df_data), col_id in zip(input_df.iterrows(), row_col_names):
-            row_id = df_data[col_name]
-            val = df_data["score"]
-            scores[col_id][row_id] = val
         scores = scores.sort_values(scores.columns[0], axis=0, ascending=False)
         return BenchmarkTableData(
             name=view_name,
             system_names=list(scores.index),
             column_names=list(scores.columns),
-            scores=[[scores[j][i] for j in scores.columns] for i in scores.index],
+            scores=scores.to_numpy().tolist(),
             plot_y_values=[pt[1] for pt in plot_dict[view_name]],
             plot_x_values=[pt[0] for pt in plot_dict[view_name]],
         )
@@ -614,27 +853,103 @@ class BenchmarkDBUtils:
             json_dict["Original"] = []
             json_dict["times"] = []
             unique_dates = sorted(list({x.created_at.date() for x in sys_infos}))
+            trend_views = {k for k, v in plot_dict.items() if v in {"all", "increase"}}
 
-            for date in unique_dates:
-                systems = [sys for sys in sys_infos if sys.created_at.date() <= date]
-                orig_df = BenchmarkDBUtils.generate_dataframe_from_sys_infos(
-                    config, systems
-                )
+            # Systems only accumulate over time, so walk them in order of creation.
+            # The datasets and columns are worked out once for all systems, and at
+            # each date only the rows of the system names that got new systems are
+            # rebuilt before running the views on all rows so far.
+            layout = BenchmarkDBUtils._dataframe_layout(config, sys_infos)
+            sys_infos = sorted(sys_infos, key=lambda x: x.created_at)
+
+            def view_max_scores(records: list[dict]) -> dict[str, float]:
+                orig_df = pd.DataFrame.from_records(records, columns=layout.columns)
                 system_dfs = BenchmarkDBUtils.generate_view_dataframes(
                     config, orig_df, by_creator=False
                 )
-                for k, v in system_dfs:
+                return {k: v.max()["score"] for k, v in system_dfs if k in trend_views}
+
+            # The views of each date are independent of each other, so they are run
+            # in parallel while the rows of the next dates are built. Only a bounded
+            # number of dates is in flight, so the rows of all dates are never held at
+            # once.
+            date_scores: list[dict[str, float]] = []
+            pending: deque[Future[dict[str, float]]] = deque()
+            max_pending = 2 * BenchmarkDBUtils._PLOT_MAX_WORKERS
+
+            def iter_date_records() -> Iterator[list[dict]]:
+                """Yield the rows of the leaderboard at each date."""
+                # without configured datasets, a dataset is only in the leaderboard once
+                # a system has been evaluated on it
+                all_datasets = bool(config.datasets)
+                seen_dataset_ids: set[int] = set()
+                name_results: defaultdict[str, list[SystemModel | None]] = defaultdict(
+                    lambda: [None] * len(layout.dataset_configs)
+                )
+                name_creators: dict[str, str] = {}
+                name_records: dict[str, list[tuple[int, dict]]] = {}
+                num_systems = 0
+                for date in unique_dates:
+                    changed_names: dict[str, None] = {}
+                    while (
+                        num_systems < len(sys_infos)
+                        and sys_infos[num_systems].created_at.date() <= date
+                    ):
+                        sys = sys_infos[num_systems]
+                        num_systems += 1
+                        dataset_id = layout.dataset_to_id.get(
+                            (
+                                sys.dataset.dataset_name,
+                                sys.dataset.sub_dataset,
+                                sys.dataset.split,
+                            )
+                        )
+                        if dataset_id is None:
+                            continue
+                        seen_dataset_ids.add(dataset_id)
+                        name_results[sys.system_name][dataset_id] = sys
+                        name_creators[sys.system_name] = sys.creator
+                        changed_names[sys.system_name] = None
+                    for name in changed_names:
+                        name_records[name] = BenchmarkDBUtils._system_records(
+                            layout, name, name_results[name], name_creators[name]
+                        )
+                    records = [
+                        record
+                        for records_of_name in name_records.values()
+                        for dataset_id, record in records_of_name
+                        if all_datasets or dataset_id in seen_dataset_ids
+                    ]
+                    yield records
+
+            with ThreadPoolExecutor(
+                max_workers=BenchmarkDBUtils._PLOT_MAX_WORKERS
+            ) as executor:
+                for records in iter_date_records():
+                    pending.append(executor.submit(view_max_scores, records))
+                    if len(pending) > max_pending:
+                        date_scores.append(pending.popleft().result())
+                while pending:
+                    date_scores.append(pending.popleft().result())
+
+            # merge the scores of all dates in order, applying the trend of each view
+            for date, scores in zip(unique_dates, date_scores):
+                for k, score in scores.items():
                     if plot_dict[k] == "all":
-                        json_dict[k].append((str(date), v.max()["score"]))
+                        json_dict[k].append([str(date), score])
                     elif plot_dict[k] == "increase":
-                        if len(json_dict[k]) == 0 or (
-                            len(json_dict[k]) > 0
-                            and json_dict[k][-1][1] < v.max()["score"]
-                        ):
-                            json_dict[k].append((str(date), v.max()["score"]))
+                        if len(json_dict[k]) == 0 or json_dict[k][-1][1] < score:
+                            json_dict[k].append([str(date), score])
             with open(plot_path, "w") as outfile:
-                json.dump(json_dict, outfile)
+                json.dump(json_dict, outfile, separators=(",", ":"))
+            # the points are lists like they would be after loading them from the file,
+            # so there's no need to read back what was just written
+            return json_dict
 
         with open(plot_path) as f:
             plot_data = json.load(f)
         return plot_data
+
+
+# the systems of benchmarks change whenever a system is created, updated or deleted
+SystemDBUtils.add_change_listener(BenchmarkDBUtils._clear_sys_infos_cache)
@@ -1,39 +1,121 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, fields
+from typing import Any, cast
+from weakref import WeakValueDictionary
 
 import flask
 from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import And, FieldFilter
 
 from explainaboard_web.models import DatasetMetadata, DatasetsReturn
 
+# a very high code point, used as the upper bound of prefix matches on strings
+_FIRESTORE_MAX_CHAR = "\uf8ff"
+
 
 @dataclass(frozen=True)
 class DatasetPrivateMetadata:
+    # many of these are kept in the metadata cache, so don't give each one a __dict__.
+    # __weakref__ is needed by DatasetDBUtils._parsed_docs.
+    __slots__ = (
+        "dataset_metadata",
+        "dataset_id",
+        "gcs_base",
+        "column_mapping",
+        "__weakref__",
+    )
+
     dataset_metadata: DatasetMetadata
     dataset_id: str
     gcs_base: str
     column_mapping: dict[str, str]
 
+    # pickle and copy restore slots with setattr, which a frozen dataclass forbids
+    def __getstate__(self) -> dict[str, Any]:
+        return {field.name: getattr(self, field.name) for field in fields(self)}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
 
 class DatasetDBUtils:
     _client: firestore.Client | None = None
     _collection: firestore.CollectionReference | None = None
+    # guards the lazy creation of the client so that concurrent requests share a
+    # single client (and gRPC channel) per process
+    _client_lock = threading.Lock()
+    # used to run independent firestore queries concurrently. It is kept small to
+    # avoid hitting the firestore quota.
+    _executor = ThreadPoolExecutor(max_workers=8)
+    # parsed metadata of recently used datasets, keyed by dataset id, along with the
+    # time it was loaded. Dataset metadata rarely changes, so it is kept for a while.
+    # The cache is kept in LRU order and bounded so that listing many datasets
+    # doesn't grow it without limit. Entries are the parsed objects themselves rather
+    # than serialized copies, so that hits cost no decoding; an external cache would
+    # need to pickle (and could compress) them instead.
+    _METADATA_CACHE_TTL = 1800.0
+    _METADATA_CACHE_SIZE = 2048
+    _metadata_cache: OrderedDict[
+        str, tuple[float, DatasetPrivateMetadata]
+    ] = OrderedDict()
+    _metadata_cache_lock = threading.Lock()
+    # metadata parsed from each version of a document, keyed by (doc id, update time),
+    # so that documents that are fetched again without changes aren't parsed again.
+    # Entries go away once nothing else refers to the metadata.
+    _parsed_docs: WeakValueDictionary[
+        tuple[str, Any], DatasetPrivateMetadata
+    ] = WeakValueDictionary()
+    # the fields of a dataset document that parse_metadata() uses
+    _METADATA_FIELDS = [
+        "dataset",
+        "sub_dataset",
+        "splits",
+        "tasks",
+        "languages",
+        "gcs_base",
+        "column_mapping",
+    ]
+    # number of datasets matching each filter the last time it was run or counted,
+    # along with the time it was run. Filters include user-supplied prefixes, so
+    # expired entries are dropped whenever a new one is recorded.
+    _CARDINALITY_TTL = 60.0
+    _cardinality_stats: dict[tuple, tuple[float, int]] = {}
+    _cardinality_lock = threading.Lock()
+    # once at most this many datasets are left, the remaining filters of
+    # find_datasets are checked in Python instead of with more queries
+    _CLIENT_FILTER_THRESHOLD = 200
+    # number of datasets that stream_datasets loads at a time, and the number of
+    # batches that it fetches ahead of the caller
+    _STREAM_BATCH_SIZE = 100
+    _PREFETCH_BATCHES = 2
 
     @staticmethod
     def get_collection() -> firestore.CollectionReference:
         if DatasetDBUtils._collection is None:
             project = flask.current_app.config["GCS_PROJECT"]
-            DatasetDBUtils._client = firestore.Client(project=project)
-            DatasetDBUtils._collection = DatasetDBUtils._client.collection(
-                "datalab_datasets"
-            )
+            with DatasetDBUtils._client_lock:
+                if DatasetDBUtils._collection is None:
+                    DatasetDBUtils._client = firestore.Client(project=project)
+                    DatasetDBUtils._collection = DatasetDBUtils._client.collection(
+                        "datalab_datasets"
+                    )
         return DatasetDBUtils._collection
 
     @staticmethod
     def parse_metadata(doc: firestore.DocumentSnapshot) -> DatasetPrivateMetadata:
         if not doc.exists:
             raise ValueError(f"Parsing non-existant doc {doc.id}")
+        key = (doc.id, doc.update_time)
+        parsed = DatasetDBUtils._parsed_docs.get(key)
+        if parsed is not None:
+            return parsed
         doc_dict = doc.to_dict()
         sub_dataset = (
             None if doc_dict["sub_dataset"] == "NA" else doc_dict["sub_dataset"]
@@ -41,22 +123,57 @@ class DatasetDBUtils:
         dataset_metadata = DatasetMetadata(
             dataset_name=doc_dict["dataset"],
             sub_dataset=sub_dataset,
-            split={x: 0 for x in doc_dict["splits"]},
+            split=dict.fromkeys(doc_dict["splits"], 0),
             tasks=doc_dict["tasks"],
             languages=doc_dict["languages"],
         )
-        return DatasetPrivateMetadata(
+        parsed = DatasetPrivateMetadata(
             dataset_metadata=dataset_metadata,
             dataset_id=doc.id,
             gcs_base=doc_dict["gcs_base"],
             column_mapping=doc_dict["column_mapping"],
         )
+        DatasetDBUtils._parsed_docs[key] = parsed
+        return parsed
+
+    @staticmethod
+    def _get_cached_metadata(dataset_id: str) -> DatasetPrivateMetadata | None:
+        cache = DatasetDBUtils._metadata_cache
+        with DatasetDBUtils._metadata_cache_lock:
+            cached = cache.get(dataset_id)
+            if cached is None:
+                return None
+            if time.monotonic() - cached[0] >= DatasetDBUtils._METADATA_CACHE_TTL:
+                del cache[dataset_id]
+                return None
+            cache.move_to_end(dataset_id)
+            return cached[1]
+
+    @staticmethod
+    def _cache_metadata(metadata: DatasetPrivateMetadata) -> None:
+        cache = DatasetDBUtils._metadata_cache
+        with DatasetDBUtils._metadata_cache_lock:
+            cache[metadata.dataset_id] = (time.monotonic(), metadata)
+            cache.move_to_end(metadata.dataset_id)
+            while len(cache) > DatasetDBUtils._METADATA_CACHE_SIZE:
+                cache.popitem(last=False)
 
     @staticmethod
     def find_dataset_by_id(dataset_id: str) -> DatasetPrivateMetadata | None:
+        metadata = DatasetDBUtils._get_cached_metadata(dataset_id)
+        if metadata is not None:
+            return metadata
         # Get the element from the collection
-        doc = DatasetDBUtils.get_collection().document(dataset_id).get()
-        return DatasetDBUtils.parse_metadata(doc) if doc.exists else None
+        doc = (
+            DatasetDBUtils.get_collection()
+            .document(dataset_id)
+            .get(field_paths=DatasetDBUtils._METADATA_FIELDS)
+        )
+        if not doc.exists:
+            return None
+        metadata = DatasetDBUtils.parse_metadata(doc)
+        DatasetDBUtils._cache_metadata(metadata)
+        return metadata
 
     @staticmethod
     def find_dataset_by_name(
@@ -68,52 +185,371 @@ class DatasetDBUtils:
         return DatasetDBUtils.find_dataset_by_id(dataset_id)
 
     @staticmethod
-    def find_datasets(
-        page: int = 0,
-        page_size: int = 0,
-        dataset_ids: list[str] | None = None,
-        dataset_name: str | None = None,
-        sub_dataset: str | None = None,
-        task: str | None = None,
-        no_limit: bool = False,
-        strict_name_match: bool = False,
-    ) -> DatasetsReturn:
-        # TODO(gneubig): If necessary, this could probably be made significantly more
-        # efficient by using a single compound query.
-        collection = DatasetDBUtils.get_collection()
-        # The set of ids, or None if we haven't filtered yet
-        ids: set[str] | None = set(dataset_ids) if dataset_ids else None
+    def _id_query(query: firestore.Query) -> firestore.Query:
+        """Make a query return only the document names, without their fields."""
+        return query.select([firestore.FieldPath.document_id()])
+
+    @staticmethod
+    def _stream_ids(query: firestore.Query) -> set[str]:
+        return {doc.id for doc in DatasetDBUtils._id_query(query).stream()}
+
+    @staticmethod
+    def get_client() -> firestore.Client:
+        if DatasetDBUtils._client is None:
+            DatasetDBUtils.get_collection()
+        return cast(firestore.Client, DatasetDBUtils._client)
+
+    @staticmethod
+    def _fetch_metadata_batch(
+        collection: firestore.CollectionReference, dataset_ids: list[str]
+    ) -> list[DatasetPrivateMetadata]:
+        """
+        Fetch the metadata of any number of datasets with a single batched read,
+        skipping the ones that don't exist
+        """
+        refs = [collection.document(x) for x in dataset_ids]
+        docs = DatasetDBUtils.get_client().get_all(
+            refs, field_paths=DatasetDBUtils._METADATA_FIELDS
+        )
+        metadatas = [DatasetDBUtils.parse_metadata(doc) for doc in docs if doc.exists]
+        for metadata in metadatas:
+            DatasetDBUtils._cache_metadata(metadata)
+        return metadatas
+
+    @staticmethod
+    def _find_metadata_by_ids(
+        collection: firestore.CollectionReference, dataset_ids: list[str]
+    ) -> dict[str, DatasetPrivateMetadata]:
+        """
+        Find the metadata of multiple datasets, only fetching the uncached ones
+        :return: a dict from dataset id to metadata, for the datasets that exist
+        """
+        id_to_metadata = {}
+        missing_ids = []
+        for dataset_id in dataset_ids:
+            metadata = DatasetDBUtils._get_cached_metadata(dataset_id)
+            if metadata is None:
+                missing_ids.append(dataset_id)
+            else:
+                id_to_metadata[dataset_id] = metadata
+        if missing_ids:
+            for metadata in DatasetDBUtils._fetch_metadata_batch(
+                collection, missing_ids
+            ):
+                id_to_metadata[metadata.dataset_id] = metadata
+        return id_to_metadata
+
+    @staticmethod
+    def _filter_query(
+        collection: firestore.CollectionReference,
+        conditions: list[tuple[str, str, Any]],
+    ) -> firestore.Query:
+        if not conditions:
+            return collection
+        field_filters = [FieldFilter(*condition) for condition in conditions]
+        composite = field_filters[0] if len(field_filters) == 1 else And(field_filters)
+        return collection.where(filter=composite)
+
+    @staticmethod
+    def _run_filter(
+        collection: firestore.CollectionReference,
+        conditions: list[tuple[str, str, Any]],
+    ) -> set[str]:
+        query = DatasetDBUtils._filter_query(collection, conditions)
+        ids = DatasetDBUtils._stream_ids(query)
+        DatasetDBUtils._record_cardinality(conditions, len(ids))
+        return ids
+
+    @staticmethod
+    def _record_cardinality(
+        conditions: list[tuple[str, str, Any]], cardinality: int
+    ) -> None:
+        now = time.monotonic()
+        ttl = DatasetDBUtils._CARDINALITY_TTL
+        stats = DatasetDBUtils._cardinality_stats
+        with DatasetDBUtils._cardinality_lock:
+            for k in [k for k, v in stats.items() if now - v[0] >= ttl]:
+                del stats[k]
+            stats[tuple(conditions)] = (now, cardinality)
+
+    @staticmethod
+    def _count(
+        collection: firestore.CollectionReference,
+        conditions: list[tuple[str, str, Any]],
+    ) -> int:
+        """
+        Count the datasets matching a filter with an aggregation query, reusing
+        recent counts. The server only walks the index, without sending the matches.
+        """
+        stats = DatasetDBUtils._cardinality_stats.get(tuple(conditions))
+        if stats is not None:
+            count_time, total = stats
+            if time.monotonic() - count_time < DatasetDBUtils._CARDINALITY_TTL:
+                return total
+        query = DatasetDBUtils._filter_query(collection, conditions)
+        total = int(query.count().get()[0][0].value)
+        DatasetDBUtils._record_cardinality(conditions, total)
+        return total
+
+    @staticmethod
+    def estimate_cardinality(field: str, op: str, value: Any) -> int:
+        """
+        Count the datasets matching a single condition, e.g.
+        `estimate_cardinality("tasks", "array_contains", "text-classification")`.
+        Counts are reused for `_CARDINALITY_TTL` seconds.
+        """
+        return DatasetDBUtils._count(
+            DatasetDBUtils.get_collection(), [(field, op, value)]
+        )
+
+    @staticmethod
+    def _matches(
+        metadata: DatasetPrivateMetadata, conditions: list[tuple[str, str, Any]]
+    ) -> bool:
+        """Check a filter in Python, the same way firestore would."""
+        dataset = metadata.dataset_metadata
+        doc_fields = {
+            "dataset": dataset.dataset_name,
+            "sub_dataset": "NA" if dataset.sub_dataset is None else dataset.sub_dataset,
+            "tasks": dataset.tasks,
+        }
+        for field, op, value in conditions:
+            field_value = doc_fields[field]
+            if op == "==":
+                matched = field_value == value
+            elif op == ">=":
+                matched = field_value >= value
+            elif op == "<":
+                matched = field_value < value
+            elif op == "array_contains":
+                matched = value in field_value
+            else:
+                raise ValueError(f"unsupported operator {op}")
+            if not matched:
+                return False
+        return True
+
+    @staticmethod
+    def _find_page_ids(
+        collection: firestore.CollectionReference,
+        page: int,
+        page_size: int,
+        dataset_ids: list[str] | None,
+        dataset_name: str | None,
+        sub_dataset: str | None,
+        task: str | None,
+        no_limit: bool,
+        strict_name_match: bool,
+    ) -> tuple[list[str], int]:
+        """
+        Find the ids of the datasets on the requested page
+        :return: the ids, and the total number of matching datasets
+        """
+        # Each filter is a list of conditions on the fields of a dataset document that
+        # is run as a single query. The equality conditions are combined into one
+        # query, which firestore answers by merging its single-field indexes. The
+        # prefix range on the dataset name would need a composite index to be
+        # combined with them, so it is kept as a separate filter.
+        filters: list[list[tuple[str, str, Any]]] = []
+        equalities: list[tuple[str, str, Any]] = []
+        prefix_match = dataset_name is not None and not strict_name_match
         if dataset_name is not None:
             if strict_name_match:
-                query = collection.where("dataset", "==", dataset_name)
+                equalities.append(("dataset", "==", dataset_name))
             else:
-                query = collection.where("dataset", ">=", dataset_name).where(
-                    "dataset", "<", dataset_name + "\uf8ff"
+                filters.append(
+                    [
+                        ("dataset", ">=", dataset_name),
+                        ("dataset", "<", dataset_name + _FIRESTORE_MAX_CHAR),
+                    ]
                 )
-            new_ids = [doc.id for doc in query.stream()]
-            ids = ids.intersection(new_ids) if ids else set(new_ids)
         if sub_dataset is not None:
-            query = collection.where("sub_dataset", "==", sub_dataset)
-            new_ids = [doc.id for doc in query.stream()]
-            ids = ids.intersection(new_ids) if ids else set(new_ids)
+            equalities.append(("sub_dataset", "==", sub_dataset))
         if task is not None:
-            query = collection.where("tasks", "array_contains", task)
-            new_ids = [doc.id for doc in query.stream()]
-            ids = ids.intersection(new_ids) if ids else set(new_ids)
+            equalities.append(("tasks", "array_contains", task))
+        if equalities:
+            filters.append(equalities)
         sid, eid = page * page_size, (page + 1) * page_size
+        paged = not (no_limit or page_size == 0)
+        if paged and not dataset_ids and len(filters) <= 1:
+            # At most one query is needed, so only the ids on the page are fetched
+            # and the total is counted on the server instead of streaming all
+            # matches. A prefix match is ordered by the name, so that firestore can
+            # walk the index of the name and stop at the end of the page.
+            conditions = filters[0] if filters else []
+            query = DatasetDBUtils._filter_query(collection, conditions)
+            if prefix_match:
+                query = query.order_by("dataset")
+            page_query = DatasetDBUtils._id_query(query).offset(sid).limit(page_size)
+            ids_list = [doc.id for doc in page_query.stream()]
+            return ids_list, DatasetDBUtils._count(collection, conditions)
+        if len(filters) > 1 and not dataset_ids:
+            # Run the filter that matches the fewest datasets first. Counting the
+            # matches of each filter is much cheaper than streaming them.
+            estimates = list(
+                DatasetDBUtils._executor.map(
+                    lambda f: DatasetDBUtils._count(collection, f), filters
+                )
+            )
+            order = sorted(range(len(filters)), key=estimates.__getitem__)
+            filters = [filters[i] for i in order]
+        # The set of ids, or None if we haven't filtered yet
+        ids: set[str] | None = set(dataset_ids) if dataset_ids else None
+        if ids is None and filters:
+            ids = DatasetDBUtils._run_filter(collection, filters.pop(0))
+        if ids is not None and filters:
+            if dataset_ids or len(ids) <= DatasetDBUtils._CLIENT_FILTER_THRESHOLD:
+                # few enough datasets are left that checking the remaining filters
+                # on them is cheaper than running more queries. This is always the
+                # case for dataset_ids: loading them takes a single batched read,
+                # while a filter query may match any number of datasets.
+                id_to_metadata = DatasetDBUtils._find_metadata_by_ids(
+                    collection, list(ids)
+                )
+                ids = {
+                    x
+                    for x, metadata in id_to_metadata.items()
+                    if all(DatasetDBUtils._matches(metadata, f) for f in filters)
+                }
+            else:
+                # The filters are independent of each other, so run them concurrently
+                for new_ids in DatasetDBUtils._executor.map(
+                    lambda f: DatasetDBUtils._run_filter(collection, f), filters
+                ):
+                    ids = ids.intersection(new_ids)
         if ids is None:
-            query = collection
+            query = DatasetDBUtils._id_query(collection)
             ids_list = [doc.id for doc in query.stream()]
         else:
             ids_list = list(ids)
         total = len(ids_list)
-        ids_list = ids_list if (no_limit or page_size == 0) else ids_list[sid:eid]
-        examps = []
+        ids_list = ids_list[sid:eid] if paged else ids_list
+        return ids_list, total
+
+    @staticmethod
+    def _load_metadata_batch(
+        collection: firestore.CollectionReference, dataset_ids: list[str]
+    ) -> list[DatasetMetadata]:
+        """Load the metadata of a batch of datasets, in order."""
+        id_to_metadata = DatasetDBUtils._find_metadata_by_ids(collection, dataset_ids)
+        return [
+            id_to_metadata[x].dataset_metadata
+            for x in dataset_ids
+            if x in id_to_metadata
+        ]
+
+    @staticmethod
+    def _iter_metadata(
+        collection: firestore.CollectionReference, dataset_ids: list[str]
+    ) -> Iterator[DatasetMetadata]:
+        """
+        Yield the metadata of datasets in order. They are loaded in batches of
+        `_STREAM_BATCH_SIZE`, and the next `_PREFETCH_BATCHES` batches are fetched
+        while the caller consumes the current one.
+        """
+        pending: deque[Future[list[DatasetMetadata]]] = deque()
+        batch_size = DatasetDBUtils._STREAM_BATCH_SIZE
+        for i in range(0, len(dataset_ids), batch_size):
+            pending.append(
+                DatasetDBUtils._executor.submit(
+                    DatasetDBUtils._load_metadata_batch,
+                    collection,
+                    dataset_ids[i : i + batch_size],
+                )
+            )
+            if len(pending) > DatasetDBUtils._PREFETCH_BATCHES:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+    @staticmethod
+    def stream_datasets(
+        page: int = 0,
+        page_size: int = 0,
+        dataset_ids: list[str] | None = None,
+        dataset_name: str | None = None,
+        sub_dataset: str | None = None,
+        task: str | None = None,
+        no_limit: bool = False,
+        strict_name_match: bool = False,
+    ) -> tuple[Iterator[DatasetMetadata], int]:
+        """
+        Like `find_datasets`, but the datasets are loaded lazily while they are
+        iterated over, so large results don't have to be held in memory at once
+        :return: an iterator over the datasets, and the total number of matches
+        """
+        collection = DatasetDBUtils.get_collection()
+        ids_list, total = DatasetDBUtils._find_page_ids(
+            collection,
+            page,
+            page_size,
+            dataset_ids,
+            dataset_name,
+            sub_dataset,
+            task,
+            no_limit,
+            strict_name_match,
+        )
+        return DatasetDBUtils._iter_metadata(collection, ids_list), total
+
+    @staticmethod
+    def find_datasets(
+        page: int = 0,
+        page_size: int = 0,
+        dataset_ids: list[str] | None = None,
+        dataset_name: str | None = None,
+        sub_dataset: str | None = None,
+        task: str | None = None,
+        no_limit: bool = False,
+        strict_name_match: bool = False,
+    ) -> DatasetsReturn:
+        collection = DatasetDBUtils.get_collection()
+        ids_list, total = DatasetDBUtils._find_page_ids(
+            collection,
+            page,
+            page_size,
+            dataset_ids,
+            dataset_name,
+            sub_dataset,
+            task,
+            no_limit,
+            strict_name_match,
+        )
+        id_to_metadata = DatasetDBUtils._find_metadata_by_ids(collection, ids_list)
+        examps = [
+            id_to_metadata[x].dataset_metadata for x in ids_list if x in id_to_metadata
+        ]
+
+        return DatasetsReturn(examps, total)
+
+    @staticmethod
+    def find_datasets_bulk(
+        specs: list[tuple[str, str | None]]
+    ) -> dict[tuple[str, str | None], list[DatasetMetadata]]:
+        """
+        Find the datasets matching each of multiple (dataset_name, sub_dataset) pairs
+        using as few queries as possible. Each pair is matched like `find_datasets`
+        with `strict_name_match=True`, so a sub_dataset of None matches all
+        sub-datasets of the dataset.
+        """
+        collection = DatasetDBUtils.get_collection()
+        names = list({name for name, _ in specs})
+        name_to_datasets: dict[str, list[DatasetMetadata]] = {x: [] for x in names}
         # We have to do this in batches because of the length 30 limit on
         # "in" queries in firestore.
-        for i in range(0, len(ids_list), 30):
-            docs = collection.where("__name__", "in", ids_list[i : i + 30]).stream()
+        for i in range(0, len(names), 30):
+            name_filter = FieldFilter("dataset", "in", names[i : i + 30])
+            docs = collection.where(filter=name_filter).stream()
             for doc in docs:
-                examps.append(DatasetDBUtils.parse_metadata(doc).dataset_metadata)
-
-        return DatasetsReturn(examps, total)
+                metadata = DatasetDBUtils.parse_metadata(doc)
+                DatasetDBUtils._cache_metadata(metadata)
+                dataset = metadata.dataset_metadata
+                name_to_datasets[dataset.dataset_name].append(dataset)
+        return {
+            (name, sub_dataset): [
+                x
+                for x in name_to_datasets[name]
+                if sub_dataset is None or x.sub_dataset == sub_dataset
+            ]
+            for name, sub_dataset in specs
+        }
@@ -7,7 +7,12 @@ from typing import TypeVar
 from bson.objectid import InvalidId, ObjectId
 from pymongo.client_session import ClientSession
 from pymongo.cursor import Cursor
-from pymongo.results import DeleteResult, InsertManyResult, UpdateResult
+from pymongo.results import (
+    BulkWriteResult,
+    DeleteResult,
+    InsertManyResult,
+    UpdateResult,
+)
 
 from explainaboard_web.impl.db import get_db
 
@@ -31,6 +36,13 @@ class DBUtils:
     BENCHMARK_FEATURED_LIST = DBCollection(
         db_name="metadata", collection_name="benchmark_featured_list"
     )
+    # (db_name, collection_name) of collections that are known to exist, so that
+    # they don't have to be checked with a list_collection_names() call every time
+    _verified_collections: set[tuple[str, str]] = set()
+    # maximum number of documents counted by find() when an estimated total is ok
+    ESTIMATED_COUNT_LIMIT = 10000
+    # maximum number of ids in a single `$in` query of find_many_by_ids()
+    FIND_BY_IDS_CHUNK_SIZE = 1000
 
     @staticmethod
     def _convert_id(_id: str | ObjectId):
@@ -40,6 +52,18 @@ class DBUtils:
         except InvalidId:
             return _id
 
+    @staticmethod
+    def _normalize_projection(
+        projection: dict | list[str] | tuple[str, ...] | None
+    ) -> dict | None:
+        """
+        Convert a list/tuple of field names into an inclusion projection so that only
+        those fields are sent over the network and decoded
+        """
+        if isinstance(projection, (list, tuple)):
+            return {field: 1 for field in projection}
+        return projection
+
     @staticmethod
     def get_database(db_name: str):
         return get_db().cx[db_name]
@@ -51,15 +75,26 @@ class DBUtils:
     @staticmethod
     def get_collection(collection: DBCollection, check_collection_exist=True):
         database = DBUtils.get_database(collection.db_name)
-        if check_collection_exist:
+        key = (collection.db_name, collection.collection_name)
+        if check_collection_exist and key not in DBUtils._verified_collections:
             collection_names = database.list_collection_names()
             if collection.collection_name in collection_names:
+                DBUtils._verified_collections.add(key)
                 return database.get_collection(collection.collection_name)
             raise DBUtilsException(
                 f"collection: {collection.collection_name} does not exist"
             )
         return database.get_collection(collection.collection_name)
 
+    @staticmethod
+    def create_index(collection: DBCollection, keys: list[tuple[str, int]]) -> str:
+        """
+        Create an index on a collection if it doesn't exist yet
+        :param keys: a list of (field, direction) pairs e.g. [('field1', 1)]
+        Returns: the name of the index
+        """
+        return DBUtils.get_collection(collection).create_index(keys)
+
     @staticmethod
     def drop(collection: DBCollection, check_collection_exist=False):
         """
@@ -68,6 +103,9 @@ class DBUtils:
               exception
         """
         DBUtils.get_collection(collection, check_collection_exist).drop()
+        DBUtils._verified_collections.discard(
+            (collection.db_name, collection.collection_name)
+        )
 
     @staticmethod
     def insert_one(
@@ -87,29 +125,87 @@ class DBUtils:
         documents: list[dict],
         check_collection_exist=True,
         session: ClientSession = None,
+        ordered: bool = True,
     ) -> InsertManyResult:
+        """
+        Insert multiple documents
+        Parameters:
+          - ordered: if `True`, the documents are inserted in order and the insertion
+                     stops at the first failure. Bulk loaders can pass `False` so
+                     that the server may insert the documents in parallel and keep
+                     going past documents that fail to insert
+        """
         return DBUtils.get_collection(collection, check_collection_exist).insert_many(
-            documents, session=session
+            documents, ordered=ordered, session=session
+        )
+
+    @staticmethod
+    def bulk_write(
+        collection: DBCollection,
+        operations: list,
+        ordered: bool = False,
+        session: ClientSession | None = None,
+    ) -> BulkWriteResult:
+        """
+        Send a mix of write operations (e.g. `pymongo.InsertOne`, `pymongo.UpdateOne`,
+        `pymongo.DeleteMany`) to the server in a single round-trip
+        Parameters:
+          - operations: the write operations to be executed
+          - ordered: if `False`, the operations may be executed in any order and the
+                     remaining operations are still executed if one fails
+        """
+        return DBUtils.get_collection(collection).bulk_write(
+            operations, ordered=ordered, session=session
         )
 
     @staticmethod
     def find_one_by_id(
         collection: DBCollection,
         docid: str | ObjectId,
-        projection: dict | None = None,
+        projection: dict | list[str] | tuple[str, ...] | None = None,
         session: ClientSession | None = None,
     ):
         """
         Find and return a document with the _id field
         Prameters:
           - id: value of _id
-          - projection: include or exclude fields in the document
+          - projection: include or exclude fields in the document, or a list of the
+                        field names to include
         """
         _id = DBUtils._convert_id(docid)
         return DBUtils.get_collection(collection).find_one(
-            {"_id": _id}, projection, session=session
+            {"_id": _id}, DBUtils._normalize_projection(projection), session=session
         )
 
+    @staticmethod
+    def find_many_by_ids(
+        collection: DBCollection,
+        docids: list[str | ObjectId],
+        projection: dict | list[str] | tuple[str, ...] | None = None,
+        session: ClientSession | None = None,
+    ) -> list[dict]:
+        """
+        Find the documents with the given _id values with one `$in` query per
+        `FIND_BY_IDS_CHUNK_SIZE` ids, instead of one query per document. Ids that
+        don't exist are skipped and the documents are not in any particular order.
+        Parameters:
+          - docids: values of _id
+          - projection: include or exclude fields in the documents, or a list of the
+                        field names to include
+        """
+        mongo_collection = DBUtils.get_collection(collection)
+        projection = DBUtils._normalize_projection(projection)
+        ids = list(dict.fromkeys(DBUtils._convert_id(docid) for docid in docids))
+        docs: list[dict] = []
+        for start in range(0, len(ids), DBUtils.FIND_BY_IDS_CHUNK_SIZE):
+            chunk = ids[start : start + DBUtils.FIND_BY_IDS_CHUNK_SIZE]
+            docs.extend(
+                mongo_collection.find(
+                    {"_id": {"$in": chunk}}, projection, session=session
+                )
+            )
+        return docs
+
     @staticmethod
     def update_one_by_id(
         collection: DBCollection,
@@ -172,9 +268,16 @@ class DBUtils:
         return int(result.deleted_count)
 
     @staticmethod
-    def count(collection: DBCollection, filt: dict = None) -> int:
-        if filt is None:
-            filt = {}
+    def count(collection: DBCollection, filt: dict = None, limit: int = 0) -> int:
+        """
+        Count the documents matching `filt`, counting at most `limit` documents if it
+        is positive. Without a filter, the count is taken from the collection
+        metadata, which doesn't require scanning the collection.
+        """
+        if not filt:
+            return DBUtils.get_collection(collection).estimated_document_count()
+        if limit > 0:
+            return DBUtils.get_collection(collection).count_documents(filt, limit=limit)
         return DBUtils.get_collection(collection).count_documents(filt)
 
     @staticmethod
@@ -184,7 +287,10 @@ class DBUtils:
         sort: list | None = None,
         skip=0,
         limit: int = 10,
-        projection: dict | None = None,
+        projection: dict | list[str] | tuple[str, ...] | None = None,
+        count_total: bool = True,
+        batch_size: int | None = None,
+        estimated_ok: bool = False,
     ) -> tuple[Cursor, int]:
         """
         Find multiple documents
@@ -195,20 +301,38 @@ class DBUtils:
           - skip: offset
           - limit: limit, pass in 0 to retrieve all documents (this is consistent with
                    the pyMongo API)
-          - projection: include or exclude certain fields
+          - projection: include or exclude certain fields, or a list of the field
+                        names to include
           (https://docs.mongodb.com/manual/tutorial/project-fields-from-query-results/)
+          - count_total: whether to count the matching documents. Counting is a
+                         second round-trip to the server, so callers that ignore
+                         the total should pass `False`
+          - batch_size: number of documents fetched per round-trip. Callers that
+                        iterate large result sets can pass a bigger value to reduce
+                        getMore round-trips. By default (`None`), PyMongo chooses
+          - estimated_ok: if `True`, counting stops after `ESTIMATED_COUNT_LIMIT`
+                          documents, for UIs that only display "about N results"
         Return:
           - a cursor that can be iterated over
           - a number that represents the total matching documents without considering
-            skip/limit
+            skip/limit, or -1 if `count_total` is `False`
         """
         if not filt:
             filt = {}
-        cursor = DBUtils.get_collection(collection).find(filt, projection)
+        cursor = DBUtils.get_collection(collection).find(
+            filt, DBUtils._normalize_projection(projection)
+        )
         if sort:
             cursor = cursor.sort(sort)
         cursor = cursor.skip(skip).limit(limit)
-        total = DBUtils.count(collection, filt)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        if not count_total:
+            total = -1
+        elif estimated_ok:
+            total = DBUtils.count(collection, filt, DBUtils.ESTIMATED_COUNT_LIMIT)
+        else:
+            total = DBUtils.count(collection, filt)
         return cursor, total
 
     CallbackRetType = TypeVar("CallbackRetType")
@@ -3,7 +3,9 @@ from __future__ import annotations
 import json
 import logging
 import re
+import threading
 import traceback
+from collections.abc import Callable
 from datetime import datetime
 from typing import Any, NamedTuple
 
@@ -32,6 +34,30 @@ from explainaboard_web.models import (
 
 class SystemDBUtils:
     _COLON_RE = r"^([A-Za-z0-9_-]+): (.+)$"
+    # called after systems are created, updated or deleted, e.g. to invalidate caches
+    # of other modules that can't be imported here without a circular import
+    _change_listeners: list[Callable[[], None]] = []
+    # incremented on every change, so that caches can tell whether systems changed
+    # while they were being loaded
+    _change_generation = 0
+    _change_lock = threading.Lock()
+
+    @staticmethod
+    def add_change_listener(listener: Callable[[], None]) -> None:
+        SystemDBUtils._change_listeners.append(listener)
+
+    @staticmethod
+    def get_change_generation() -> int:
+        return SystemDBUtils._change_generation
+
+    @staticmethod
+    def _notify_change() -> None:
+        # bump the generation before notifying, so that loads that are still running
+        # don't put their results back into the caches cleared by the listeners
+        with SystemDBUtils._change_lock:
+            SystemDBUtils._change_generation += 1
+        for listener in SystemDBUtils._change_listeners:
+            listener()
 
     @staticmethod
     def _parse_colon_line(line) -> tuple[str, str]:
@@ -298,6 +324,7 @@ class SystemDBUtils:
                     abort_with_error_message(400, str(e))
 
             DBUtils.execute_transaction(db_operations)
+            SystemDBUtils._notify_change()
             return system
 
     @staticmethod
@@ -316,9 +343,11 @@ class SystemDBUtils:
             "system_tags": metadata.system_tags,
         }
 
-        return DBUtils.update_one_by_id(
+        updated = DBUtils.update_one_by_id(
             DBUtils.DEV_SYSTEM_METADATA, system_id, field_to_value
         )
+        SystemDBUtils._notify_change()
+        return updated
 
     @staticmethod
     def find_system_by_id(system_id: str):
@@ -387,6 +416,7 @@ class SystemDBUtils:
         if sys.creator != user.id:
             abort_with_error_message(403, "you can only delete your own systems")
         sys.delete()
+        SystemDBUtils._notify_change()
 
 
 class FindSystemsReturn(NamedTuple):
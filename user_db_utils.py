@@ -45,12 +45,11 @@ class UserDBUtils:
 
     @staticmethod
     def find_users(ids: list[str]) -> list[User]:
-        filt = {"_id": {"$in": ids}}
-        cursor, _ = DBUtils.find(DBUtils.USER_METADATA, filt=filt, limit=0)
+        docs = DBUtils.find_many_by_ids(DBUtils.USER_METADATA, ids)
 
         users = []
 
-        for doc in cursor:
+        for doc in docs:
             doc["id"] = doc["_id"]
             users.append(User.from_dict(doc))
 